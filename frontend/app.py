@@ -8,11 +8,13 @@ Run:
 streamlit run frontend/app.py
 """
 import streamlit as st
+from streamlit_autorefresh import st_autorefresh
 import json
-import time
-import threading
-import queue
-from collections import deque
+import operator
+import re
+import struct
+import numpy as np
+import pandas as pd
 
 # Optional imports at runtime
 try:
@@ -21,17 +23,75 @@ try:
 except Exception:
     serial = None
     list_ports = None
+try:
+    import zstandard as zstd
+except Exception:
+    zstd = None
+try:
+    import orjson
+    json_loads = orjson.loads
+except Exception:
+    orjson = None
+    # one decoder instance reused for every line; skips json.loads' per-call
+    # encoding detection and argument handling
+    json_decode = json.JSONDecoder().decode
+    def json_loads(line):
+        return json_decode(line.decode("utf-8"))
 import socket
 
 st.set_page_config(page_title="Solar Tracker Telemetry", layout="wide")
 
 st.title("Dual-Axis Solar Tracker — Telemetry Dashboard")
 
+HISTORY = 500  # number of telemetry points kept for the charts
+REFRESH_MS = 500  # matches the simulator/firmware send interval
+FIELDS = ("t", "az", "el", "ia", "ib", "v")
+row_fields = operator.itemgetter(*FIELDS)  # one lookup pass per telemetry dict
+# Binary telemetry frame sent by `simulator.py --binary`; must match FRAME there
+FRAME = struct.Struct("<Qhhhhfff")
+frame_fields = operator.itemgetter(0, 1, 2, 5, 6, 7)  # t, az, el, ia, ib, v
+
+# Empty chart frames; rows are appended as telemetry arrives. Angles are whole
+# degrees in the protocol, so they stay integers; electrical values use float64
+# so the firmware's decimals are not blurred by float32 rounding.
+def new_frame(columns, dtype):
+    return pd.DataFrame(index=pd.DatetimeIndex([]), columns=columns, dtype=dtype)
+
+# Vega-Lite line spec for a time-indexed frame. The wide frame is folded
+# client-side instead of being melted by st.line_chart on every rerun. Built
+# fresh per call: st.vega_lite_chart patches nested parts of the spec in place.
+def line_spec(columns):
+    return {
+        "mark": "line",
+        "transform": [{"fold": columns, "as": ["series", "value"]}],
+        "encoding": {
+            "x": {"field": "time", "type": "temporal", "title": None},
+            "y": {"field": "value", "type": "quantitative", "title": None},
+            "color": {"field": "series", "type": "nominal", "title": None},
+        },
+    }
+
+# Render a persistent chart frame
+def line_chart(df):
+    st.vega_lite_chart(df.reset_index(names="time"), line_spec(list(df.columns)))
+
+# Append a batch of (t, az, el, ia, ib, v) rows to the persistent chart frames,
+# the only telemetry history kept (one concat per rerun)
+def frames_extend(rows):
+    t, az, el, ia, ib, v = zip(*rows[-HISTORY:])
+    index = pd.to_datetime(np.asarray(t, dtype=np.int64), unit="ms")
+    new_ang = pd.DataFrame({"Azimuth": az, "Elevation": el}, index=index, dtype="int64")
+    new_elec = pd.DataFrame({"Ia": ia, "Ib": ib, "V": v}, index=index, dtype="float64")
+    for key, new in (("df_ang", new_ang), ("df_elec", new_elec)):
+        old = st.session_state[key]
+        st.session_state[key] = new if old.empty else pd.concat([old, new]).iloc[-HISTORY:]
+
 # Session state containers
 if "running" not in st.session_state:
     st.session_state.running = False
-if "data" not in st.session_state:
-    st.session_state.data = deque(maxlen=500)  # store last N telemetry points
+if "df_ang" not in st.session_state:  # store last N telemetry points
+    st.session_state.df_ang = new_frame(["Azimuth", "Elevation"], "int64")
+    st.session_state.df_elec = new_frame(["Ia", "Ib", "V"], "float64")
 
 # Source selection UI
 col1, col2 = st.columns([1, 2])
@@ -42,104 +102,187 @@ if source == "Serial":
     baud = st.number_input("Baudrate", value=115200)
 else:
     port = st.text_input("Host (for TCP)", value="127.0.0.1:9999")
+    binary = st.checkbox("Binary frames (simulator --binary)", value=False)
+    compressed = st.checkbox("zstd-compressed stream (simulator --zstd)", value=False)
 
 start_stop = st.button("Start" if not st.session_state.running else "Stop")
 
-# Background reader thread and queue
-if "queue" not in st.session_state:
-    st.session_state.queue = queue.Queue()
+# Telemetry source, opened non-blocking and drained at the start of every rerun
+# (no reader thread: the script already reruns at the telemetry rate)
+if "conn" not in st.session_state:
+    st.session_state.conn = None  # socket or serial.Serial while running
+    st.session_state.rx_buf = bytearray()  # bytes received but not yet a full record
+    st.session_state.binary = False
+    st.session_state.decompress = None  # zstd stream decompressor for TCP
 
-def serial_reader_loop(port_name, baudrate, q):
-    try:
-        ser = serial.Serial(port_name, baudrate, timeout=1)
-    except Exception as e:
-        q.put({"error": f"Serial open error: {e}"})
-        return
-    try:
-        while st.session_state.running:
-            line = ser.readline().decode("utf-8").strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-                q.put(obj)
-            except Exception as e:
-                # ignore parse failures
-                pass
-    finally:
-        ser.close()
+# Specialized parser for the exact line layout the firmware and simulator emit;
+# anything else falls back to the general JSON parser. It is faster than the
+# stdlib decoder but ~4x slower than orjson, so it only replaces the fallback.
+TELEMETRY_RE = re.compile(
+    rb'\{"t":(\d+),"az":(-?\d+),"el":(-?\d+),"pwm_az":(-?\d+),"pwm_el":(-?\d+),'
+    rb'"ia":(-?[\d.]+),"ib":(-?[\d.]+),"v":(-?[\d.]+)\}'
+)
+match_telemetry = TELEMETRY_RE.fullmatch
+
+# Both parsers return the (t, az, el, ia, ib, v) row kept for display, with
+# the types the chart frames store; int()/float() reject nulls and strings
+def parse_json(line):
+    t, az, el, ia, ib, v = row_fields(json_loads(line))
+    return int(t), int(az), int(el), float(ia), float(ib), float(v)
+
+def parse_fast(line):
+    m = match_telemetry(line)
+    if m is None:
+        return parse_json(line)
+    t, az, el, _, _, ia, ib, v = m.groups()
+    return int(t), int(az), int(el), float(ia), float(ib), float(v)
+
+parse_line = parse_json if orjson is not None else parse_fast
+
+MAX_T_MS = (2**63 - 1) // 10**6  # last millisecond a datetime64[ns] index can hold
+INT64_MAX = 2**63 - 1
+
+# Range check so frames_extend never fails on a row a parser accepted
+def row_ok(row):
+    t, az, el = row[:3]
+    return 0 <= t <= MAX_T_MS and -INT64_MAX <= az <= INT64_MAX and -INT64_MAX <= el <= INT64_MAX
 
-def tcp_reader_loop(host, portnum, q):
+# Parse every complete line in `data`, skipping blanks and parse failures
+def parse_lines(data, rows):
+    for line in data.split(b"\n"):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = parse_line(line)
+        except Exception:
+            # ignore parse failures
+            continue
+        if row_ok(row):
+            rows.append(row)
+
+def open_serial(port_name, baudrate):
+    # timeout=0 makes read() return whatever is already buffered
+    return serial.Serial(port_name, baudrate, timeout=0)
+
+def open_tcp(host, portnum):
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # disable Nagle and enlarge the kernel receive window; telemetry piles up
+    # there between reruns
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 262144)
+    s.settimeout(5)
     try:
         s.connect((host, portnum))
-    except Exception as e:
-        q.put({"error": f"TCP connect error: {e}"})
-        return
-    f = s.makefile("r")
-    try:
-        while st.session_state.running:
-            line = f.readline()
-            if not line:
-                time.sleep(0.1)
-                continue
+    except Exception:
+        s.close()
+        raise
+    s.setblocking(False)
+    return s
+
+# Append everything currently pending on the source to `buf`, decompressing
+# TCP data when `decompress` is set.
+# Returns False once a TCP peer has closed the connection.
+def drain(conn, buf, decompress=None):
+    if isinstance(conn, socket.socket):
+        while True:
             try:
-                obj = json.loads(line)
-                q.put(obj)
-            except Exception:
-                pass
-    finally:
+                chunk = conn.recv(65536)
+            except BlockingIOError:
+                return True
+            if not chunk:
+                return False
+            buf += decompress(chunk) if decompress else chunk
+    buf += conn.read(conn.in_waiting)
+    return True
+
+def close_source():
+    if st.session_state.conn is not None:
         try:
-            s.close()
-        except:
+            st.session_state.conn.close()
+        except Exception:
             pass
+        st.session_state.conn = None
 
 # Start/stop handling
 if start_stop:
     if not st.session_state.running:
         st.session_state.running = True
         # clear old data
-        st.session_state.data.clear()
-        # start reader thread
-        st.session_state.queue = queue.Queue()
+        st.session_state.df_ang = new_frame(["Azimuth", "Elevation"], "int64")
+        st.session_state.df_elec = new_frame(["Ia", "Ib", "V"], "float64")
+        # open the source
+        close_source()
+        st.session_state.rx_buf = bytearray()
+        st.session_state.binary = False
+        st.session_state.decompress = None
         if source == "Serial":
             if serial is None:
                 st.error("pyserial is not installed in this environment. Install via pip install pyserial")
                 st.session_state.running = False
             else:
-                t = threading.Thread(target=serial_reader_loop, args=(port, baud, st.session_state.queue), daemon=True)
-                t.start()
+                try:
+                    st.session_state.conn = open_serial(port, baud)
+                except Exception as e:
+                    st.error(f"Serial open error: {e}")
+                    st.session_state.running = False
+        elif source == "TCP" and compressed and zstd is None:
+            st.error("zstandard is not installed in this environment. Install via pip install zstandard")
+            st.session_state.running = False
         elif source == "TCP":
             # parse host:port
             try:
                 host, portnum = port.split(":")
                 portnum = int(portnum)
-                t = threading.Thread(target=tcp_reader_loop, args=(host, portnum, st.session_state.queue), daemon=True)
-                t.start()
             except Exception as e:
                 st.error(f"Invalid host:port — {e}")
                 st.session_state.running = False
+            else:
+                try:
+                    st.session_state.conn = open_tcp(host, portnum)
+                    st.session_state.binary = binary
+                    if compressed:
+                        st.session_state.decompress = zstd.ZstdDecompressor().decompressobj().decompress
+                except Exception as e:
+                    st.error(f"TCP connect error: {e}")
+                    st.session_state.running = False
         else:
             st.session_state.running = False
     else:
         st.session_state.running = False
+        close_source()
 
 # Display area
 placeholder = st.empty()
 
-# Helper to consume queue and push into session_state.data
-def consume_queue():
-    q = st.session_state.queue
-    while not q.empty():
-        try:
-            item = q.get_nowait()
-        except queue.Empty:
-            break
-        if isinstance(item, dict) and "error" in item:
-            st.error(item["error"])
-            st.session_state.running = False
-            break
-        st.session_state.data.append(item)
+# Helper to read pending telemetry and push it into the chart frames
+def consume_source():
+    conn = st.session_state.conn
+    if conn is None:
+        return
+    buf = st.session_state.rx_buf
+    try:
+        alive = drain(conn, buf, st.session_state.decompress)
+    except Exception as e:
+        alive = False
+        st.error(f"Telemetry read error: {e}")
+    else:
+        if not alive:
+            st.error("TCP connection closed by peer")
+    rows = []
+    if st.session_state.binary:
+        # fixed-size frames: one unpack per record, no text parsing
+        end = len(buf) - len(buf) % FRAME.size
+        rows.extend(filter(row_ok, map(frame_fields, FRAME.iter_unpack(bytes(buf[:end])))))
+    else:
+        end = buf.rfind(b"\n") + 1
+        parse_lines(bytes(buf[:end]), rows)
+    del buf[:end]
+    if not alive:
+        st.session_state.running = False
+        close_source()
+    if rows:
+        frames_extend(rows)
 
 # Main UI update
 with placeholder.container():
@@ -147,52 +290,38 @@ with placeholder.container():
     with status_col:
         st.write("Status")
         st.write("Running" if st.session_state.running else "Stopped")
-        st.write(f"Buffered points: {len(st.session_state.data)}")
-        if st.session_state.data:
-            last = st.session_state.data[-1]
-            st.write("Last timestamp:", last.get("t"))
+        st.write(f"Buffered points: {len(st.session_state.df_ang)}")
+        if not st.session_state.df_ang.empty:
+            st.write("Last timestamp:", st.session_state.df_ang.index[-1].value // 1_000_000)
     with metrics_col:
         # consume incoming data
-        consume_queue()
-
-        # Prepare lists for charts
-        times = [d.get("t", i) for i, d in enumerate(st.session_state.data)]
-        az_list = [d.get("az") for d in st.session_state.data]
-        el_list = [d.get("el") for d in st.session_state.data]
-        ia_list = [d.get("ia") for d in st.session_state.data]
-        ib_list = [d.get("ib") for d in st.session_state.data]
-        v_list = [d.get("v") for d in st.session_state.data]
+        consume_source()
 
         # Top metrics
         cols = st.columns(4)
-        if st.session_state.data:
-            last = st.session_state.data[-1]
-            cols[0].metric("Azimuth (deg)", last.get("az", "-"))
-            cols[1].metric("Elevation (deg)", last.get("el", "-"))
-            cols[2].metric("Servo A Current (A)", last.get("ia", "-"))
-            cols[3].metric("Supply Voltage (V)", last.get("v", "-"))
+        if not st.session_state.df_ang.empty:
+            last_ang = st.session_state.df_ang.iloc[-1]
+            last_elec = st.session_state.df_elec.iloc[-1]
+            cols[0].metric("Azimuth (deg)", int(last_ang["Azimuth"]))
+            cols[1].metric("Elevation (deg)", int(last_ang["Elevation"]))
+            cols[2].metric("Servo A Current (A)", round(float(last_elec["Ia"]), 3))
+            cols[3].metric("Supply Voltage (V)", round(float(last_elec["V"]), 2))
         else:
             cols[0].metric("Azimuth (deg)", "-")
             cols[1].metric("Elevation (deg)", "-")
             cols[2].metric("Servo A Current (A)", "-")
             cols[3].metric("Supply Voltage (V)", "-")
 
-        # Charts
-        chart_cols = st.columns(2)
-        with chart_cols[0]:
-            st.subheader("Servo angles")
-            import pandas as pd
-            df = pd.DataFrame({"Azimuth": az_list, "Elevation": el_list})
-            if not df.empty:
-                df.index = pd.to_datetime(times, unit="ms")
-                st.line_chart(df)
-        with chart_cols[1]:
-            st.subheader("Electrical metrics")
-            df2 = pd.DataFrame({"Ia": ia_list, "Ib": ib_list, "V": v_list})
-            if not df2.empty:
-                df2.index = pd.to_datetime(times, unit="ms")
-                st.line_chart(df2)
-
-# Auto-refresh while running
+        # Charts (skipped entirely until the first sample arrives)
+        if not st.session_state.df_ang.empty:
+            chart_cols = st.columns(2)
+            with chart_cols[0]:
+                st.subheader("Servo angles")
+                line_chart(st.session_state.df_ang)
+            with chart_cols[1]:
+                st.subheader("Electrical metrics")
+                line_chart(st.session_state.df_elec)
+
+# Auto-refresh while running, paced to the telemetry rate
 if st.session_state.running:
-    st.experimental_rerun()
+    st_autorefresh(interval=REFRESH_MS, key="tick")
@@ -2,55 +2,189 @@
 """
 Simple TCP telemetry simulator sending JSON lines to clients.
 Use it to test the Streamlit frontend without hardware.
+With --binary it sends fixed-size packed frames (see FRAME) instead.
+With --zstd the stream is zstd-compressed (one frame per connection,
+flushed block by block), for bandwidth-limited links.
 
 Example:
 python simulator.py --host 127.0.0.1 --port 9999
 """
 import argparse
-import json
+import selectors
 import socket
-import threading
+import struct
 import time
-import random
+import numpy as np
 
-def handle_client(conn, addr):
-    print("Client connected:", addr)
+# Optional imports at runtime
+try:
+    import zstandard as zstd
+except Exception:
+    zstd = None
+
+# The telemetry schema is fixed, so lines are formatted straight to bytes
+# (same layout and precision as the firmware) instead of going through a
+# dict and a JSON encoder.
+TEMPLATE = b'{"t":%d,"az":%d,"el":%d,"pwm_az":%d,"pwm_el":%d,"ia":%.3f,"ib":%.3f,"v":%.2f}\n'
+
+# Binary frame: t, az, el, pwm_az, pwm_el, ia, ib, v (28 bytes, little-endian).
+# Must match FRAME in app.py.
+FRAME = struct.Struct("<Qhhhhfff")
+
+BATCH = 1024  # samples generated per numpy call
+
+# Yields (az, el, ia, ib, v) samples; the random numbers are drawn BATCH at a
+# time with vectorized numpy calls and converted to plain Python values once.
+def telemetry_samples(rng):
+    while True:
+        u = rng.uniform(-1, 1, size=(BATCH, 3))
+        r = rng.random((BATCH, 2))
+        scale = rng.choice([1, 0.5, 0.2], size=BATCH)
+        az = (90 + 20 * u[:, 0] * scale).astype(np.int64)
+        el = (45 + 10 * u[:, 1]).astype(np.int64)
+        ia = 0.08 + r[:, 0] * 0.05
+        ib = 0.07 + r[:, 1] * 0.05
+        v = 12.0 + 0.2 * u[:, 2]
+        yield from zip(az.tolist(), el.tolist(), ia.tolist(), ib.tolist(), v.tolist())
+
+MAX_BACKLOG = 65536  # unsent bytes after which a client is considered stuck
+ACCEPT_RETRY = 0.5  # seconds to stop accepting after an accept error
+
+# Returns False if the connection could not be accepted (e.g. EMFILE when out
+# of file descriptors); existing clients are unaffected
+def accept_client(srv, sel, compress):
     try:
-        while True:
-            t = int(time.time() * 1000)
-            az = int(90 + 20 * random.uniform(-1, 1) * random.choice([1,0.5,0.2]))
-            el = int(45 + 10 * random.uniform(-1, 1))
-            pwm_az = az
-            pwm_el = el
-            ia = round(0.08 + random.random() * 0.05, 3)
-            ib = round(0.07 + random.random() * 0.05, 3)
-            v = round(12.0 + random.uniform(-0.2, 0.2), 2)
-            payload = {"t": t, "az": az, "el": el, "pwm_az": pwm_az, "pwm_el": pwm_el, "ia": ia, "ib": ib, "v": v}
-            line = json.dumps(payload) + "\n"
-            conn.sendall(line.encode("utf-8"))
-            time.sleep(0.5)
-    except (BrokenPipeError, ConnectionResetError):
-        print("Client disconnected:", addr)
-    finally:
+        conn, addr = srv.accept()
+    except (BlockingIOError, InterruptedError):
+        return True
+    except OSError as e:
+        print("Accept failed:", e)
+        return False
+    try:
+        conn.setblocking(False)
+        # flush each small telemetry line immediately instead of coalescing, and
+        # give the kernel room to absorb bursts without blocking the server
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 131072)
+    except OSError as e:
+        print("Accept failed:", e)
         conn.close()
+        return True
+    print("Client connected:", addr)
+    state = {
+        "addr": addr,
+        "samples": telemetry_samples(np.random.default_rng()),
+        "next_send": time.monotonic(),
+        "out": bytearray(),  # bytes the kernel has not accepted yet
+        # one streaming compressor per client; the window carries over between
+        # samples so repeated key names cost almost nothing
+        "zstd": zstd.ZstdCompressor(level=1).compressobj() if compress else None,
+    }
+    # readable only matters for noticing the client hang up
+    sel.register(conn, selectors.EVENT_READ, state)
+    return True
+
+def drop_client(conn, sel, state):
+    print("Client disconnected:", state["addr"])
+    sel.unregister(conn)
+    conn.close()
+
+# Encoders for a (t, az, el, pwm_az, pwm_el, ia, ib, v) tuple, picked once per
+# server. The JSON key names and separators are precomputed in TEMPLATE, so a
+# single %-format writes only the numeric fields (measured faster than
+# assembling the line piecewise into a reused bytearray).
+def encode_json(values):
+    return TEMPLATE % values
+
+def encode_binary(values):
+    return FRAME.pack(*values)
+
+# Queue the next sample for a client and push as much as the socket takes
+def send_sample(conn, state, encode):
+    out = state["out"]
+    t = int(time.time() * 1000)
+    az, el, ia, ib, v = next(state["samples"])
+    # pwm_az/pwm_el mirror the angles
+    data = encode((t, az, el, az, el, ia, ib, v))
+    if state["zstd"] is not None:
+        # flush a block (not the frame) so the sample is decodable right away
+        data = state["zstd"].compress(data) + state["zstd"].flush(zstd.COMPRESSOBJ_FLUSH_BLOCK)
+    out += data
+    try:
+        sent = conn.send(out)
+    except BlockingIOError:
+        sent = 0
+    del out[:sent]
+    if len(out) > MAX_BACKLOG:
+        raise ConnectionResetError("client is not reading")
 
-def run_server(host, port):
+# Single-threaded server: one selector watches the listening socket and every
+# client, and each client is sent a sample whenever its deadline passes.
+def run_server(host, port, interval=0.5, binary=False, compress=False):
     srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     srv.bind((host, port))
-    srv.listen(1)
+    srv.listen(128)
+    srv.setblocking(False)
+    sel = selectors.DefaultSelector()
+    sel.register(srv, selectors.EVENT_READ)
+    encode = encode_binary if binary else encode_json
     print(f"Simulator listening on {host}:{port}")
+    accept_paused_until = None
     try:
         while True:
-            conn, addr = srv.accept()
-            t = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
-            t.start()
+            if accept_paused_until is not None and time.monotonic() >= accept_paused_until:
+                sel.register(srv, selectors.EVENT_READ)
+                accept_paused_until = None
+            clients = [(key.fileobj, key.data) for key in sel.get_map().values() if key.data is not None]
+            deadlines = [state["next_send"] for _, state in clients]
+            if accept_paused_until is not None:
+                deadlines.append(accept_paused_until)
+            timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            for key, _ in sel.select(timeout):
+                if key.data is None:
+                    if not accept_client(srv, sel, compress):
+                        # the pending connection stays queued, so stop watching
+                        # the listener for a moment instead of spinning on it
+                        sel.unregister(srv)
+                        accept_paused_until = time.monotonic() + ACCEPT_RETRY
+                    continue
+                try:
+                    data = key.fileobj.recv(1024)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except OSError:
+                    data = b""
+                if not data:
+                    drop_client(key.fileobj, sel, key.data)
+            now = time.monotonic()
+            for conn, state in clients:
+                # skip clients that are not due or were dropped above
+                if state["next_send"] > now or conn.fileno() == -1:
+                    continue
+                try:
+                    send_sample(conn, state, encode)
+                except OSError:
+                    drop_client(conn, sel, state)
+                    continue
+                # keep a steady cadence, but don't burst to catch up after a stall
+                state["next_send"] += interval
+                if state["next_send"] < now:
+                    state["next_send"] = now + interval
     finally:
+        for key in list(sel.get_map().values()):
+            key.fileobj.close()
+        sel.close()
         srv.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--host", default="127.0.0.1")
     parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between telemetry lines")
+    parser.add_argument("--binary", action="store_true", help="send packed binary frames instead of JSON lines")
+    parser.add_argument("--zstd", action="store_true", help="zstd-compress the stream (requires zstandard; only helps JSON lines)")
     args = parser.parse_args()
-    run_server(args.host, args.port)
+    if args.zstd and zstd is None:
+        parser.error("--zstd requires zstandard; install via pip install zstandard")
+    run_server(args.host, args.port, args.interval, args.binary, args.zstd)